@@ -164,6 +164,7 @@ def ensure_tables_exist(db_config=None, schema='pharmacy'):
 
         # Create indexes
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_pharm_geom ON {s}.pharmacies USING GIST (geom)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_pharm_geog ON {s}.pharmacies USING GIST ((geom::geography))")
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_pharm_nom ON {s}.pharmacies (nom)")
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_pharm_ville ON {s}.pharmacies (ville)")
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_gardes_date ON {s}.gardes (date_garde)")
@@ -6,6 +6,7 @@ All SQL queries use schema-qualified table names for integration support.
 from flask import Blueprint, request, jsonify
 from datetime import date
 import unicodedata
+from math import radians, cos, sin, asin, sqrt
 from .database import get_db_cursor, test_connection, qualified_table
 from .cache import cache, make_cache_key_nearby, make_cache_key_search
 from . import get_module_config
@@ -20,6 +21,106 @@ def normalize_city(name):
     name = ''.join(c for c in name if unicodedata.category(c) != 'Mn')
     return name
 
+
+# Coordinates of all Cameroon cities covered by the scraper.
+# Used to infer the user's city when no nearby pharmacy is found in the DB.
+FALLBACK_CITY_COORDS = {
+    # Adamaoua
+    'Banyo':       (6.7500, 11.8167),
+    'Ngaoundéré':  (7.3167, 13.5833),
+    # Centre
+    'Bafia':       (4.7500, 11.2333),
+    'Mbalmayo':    (3.5167, 11.5000),
+    'Mbandjock':   (4.4500, 11.9000),
+    'Mbankomo':    (3.7833, 11.3833),
+    'Obala':       (4.1667, 11.5333),
+    'Sa A':        (4.3667, 11.4500),
+    'Yaoundé':     (3.8667, 11.5167),
+    # Est
+    'Abong-Mbang': (3.9833, 13.1833),
+    'Batouri':     (4.4333, 14.3667),
+    'Bertoua':     (4.5833, 13.6833),
+    'Garoua-Boulai': (5.8833, 14.5500),
+    # Extrême-Nord
+    'Kousseri':    (12.0767, 15.0306),
+    'Maga':        (10.8500, 14.9500),
+    'Maroua':      (10.5956, 14.3159),
+    'Yagoua':      (10.3417, 15.2333),
+    # Littoral
+    'Douala':      (4.0511, 9.7679),
+    'Edea':        (3.8000, 10.1333),
+    'Loum':        (4.7167, 9.7333),
+    'Mbanga':      (4.5000, 9.5667),
+    'Melong':      (5.1167, 9.9500),
+    'Nkongsamba':  (4.9500, 9.9333),
+    # Nord
+    'Figuil':      (9.7583, 13.9667),
+    'Garoua':      (9.3000, 13.3833),
+    'Guider':      (9.9333, 13.9500),
+    'Touboro':     (7.7667, 15.3667),
+    # Nord-Ouest
+    'Bamenda':     (5.9597, 10.1597),
+    'Mbengwy':     (6.1000, 10.0000),
+    # Ouest
+    'Bafang':      (5.1667, 10.1833),
+    'Bafoussam':   (5.4737, 10.4176),
+    'Bangangté':   (5.1500, 10.5333),
+    'Bandja':      (5.3333, 10.3667),
+    'Bandjoun':    (5.3667, 10.4167),
+    'Dschang':     (5.4500, 10.0500),
+    'Foumban':     (5.7167, 10.8833),
+    'Foumbot':     (5.5167, 10.6167),
+    'Mbouda':      (5.6333, 10.2500),
+    # Sud
+    'Ambam':       (2.3833, 11.2833),
+    'Ebolowa':     (2.9000, 11.1500),
+    'Kribi':       (2.9500, 9.9167),
+    'Sangmelima':  (2.9333, 11.9833),
+    # Sud-Ouest
+    'Buea':        (4.1597, 9.2311),
+    'Kumba':       (4.6333, 9.4500),
+    'Likomba':     (4.0833, 9.2667),
+    'Limbe':       (4.0167, 9.2000),
+    'Mutengene':   (4.0917, 9.3083),
+    'Muyuka':      (4.2833, 9.4167),
+}
+
+EARTH_RADIUS_M = 6371000
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points, in meters."""
+    d_lat = radians(lat2 - lat1)
+    d_lon = radians(lon2 - lon1)
+    a = sin(d_lat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(sqrt(a))
+
+
+def _nearest_fallback_city(lat, lon):
+    """
+    Find the closest city in FALLBACK_CITY_COORDS.
+    
+    Cities are ranked by equirectangular squared distance (one cos for the
+    whole scan, no sqrt); only the winner gets an exact haversine distance.
+    
+    Returns:
+        tuple: (city_name, distance_m)
+    """
+    lon_scale = cos(radians(lat))
+    best_city = None
+    best_sq = float('inf')
+    for city_name, (f_lat, f_lon) in FALLBACK_CITY_COORDS.items():
+        d_lat = f_lat - lat
+        d_lon = (f_lon - lon) * lon_scale
+        d_sq = d_lat * d_lat + d_lon * d_lon
+        if d_sq < best_sq:
+            best_sq = d_sq
+            best_city = city_name
+    
+    f_lat, f_lon = FALLBACK_CITY_COORDS[best_city]
+    return best_city, _haversine_m(lat, lon, f_lat, f_lon)
+
+
 api_bp = Blueprint('pharmacy_api', __name__)
 
 
@@ -111,69 +212,6 @@ def get_nearby_pharmacies():
         # 1. Infer User's City (to filter unmatched pharmacies)
         # We find the city of the nearest known pharmacy to the user
         
-        # Dictionary of coordinates for all Cameroon cities covered by the scraper.
-        # Used to infer the user's city when no nearby pharmacy is found in the DB.
-        FALLBACK_CITY_COORDS = {
-            # Adamaoua
-            'Banyo':       (6.7500, 11.8167),
-            'Ngaoundéré':  (7.3167, 13.5833),
-            # Centre
-            'Bafia':       (4.7500, 11.2333),
-            'Mbalmayo':    (3.5167, 11.5000),
-            'Mbandjock':   (4.4500, 11.9000),
-            'Mbankomo':    (3.7833, 11.3833),
-            'Obala':       (4.1667, 11.5333),
-            'Sa A':        (4.3667, 11.4500),
-            'Yaoundé':     (3.8667, 11.5167),
-            # Est
-            'Abong-Mbang': (3.9833, 13.1833),
-            'Batouri':     (4.4333, 14.3667),
-            'Bertoua':     (4.5833, 13.6833),
-            'Garoua-Boulai': (5.8833, 14.5500),
-            # Extrême-Nord
-            'Kousseri':    (12.0767, 15.0306),
-            'Maga':        (10.8500, 14.9500),
-            'Maroua':      (10.5956, 14.3159),
-            'Yagoua':      (10.3417, 15.2333),
-            # Littoral
-            'Douala':      (4.0511, 9.7679),
-            'Edea':        (3.8000, 10.1333),
-            'Loum':        (4.7167, 9.7333),
-            'Mbanga':      (4.5000, 9.5667),
-            'Melong':      (5.1167, 9.9500),
-            'Nkongsamba':  (4.9500, 9.9333),
-            # Nord
-            'Figuil':      (9.7583, 13.9667),
-            'Garoua':      (9.3000, 13.3833),
-            'Guider':      (9.9333, 13.9500),
-            'Touboro':     (7.7667, 15.3667),
-            # Nord-Ouest
-            'Bamenda':     (5.9597, 10.1597),
-            'Mbengwy':     (6.1000, 10.0000),
-            # Ouest
-            'Bafang':      (5.1667, 10.1833),
-            'Bafoussam':   (5.4737, 10.4176),
-            'Bangangté':   (5.1500, 10.5333),
-            'Bandja':      (5.3333, 10.3667),
-            'Bandjoun':    (5.3667, 10.4167),
-            'Dschang':     (5.4500, 10.0500),
-            'Foumban':     (5.7167, 10.8833),
-            'Foumbot':     (5.5167, 10.6167),
-            'Mbouda':      (5.6333, 10.2500),
-            # Sud
-            'Ambam':       (2.3833, 11.2833),
-            'Ebolowa':     (2.9000, 11.1500),
-            'Kribi':       (2.9500, 9.9167),
-            'Sangmelima':  (2.9333, 11.9833),
-            # Sud-Ouest
-            'Buea':        (4.1597, 9.2311),
-            'Kumba':       (4.6333, 9.4500),
-            'Likomba':     (4.0833, 9.2667),
-            'Limbe':       (4.0167, 9.2000),
-            'Mutengene':   (4.0917, 9.3083),
-            'Muyuka':      (4.2833, 9.4167),
-        }
-        
         # Step A: Find nearest in DB
         t_pharmacies = qualified_table('pharmacies')
         t_gardes = qualified_table('gardes')
@@ -198,20 +236,10 @@ def get_nearby_pharmacies():
         # Step B: Check fallback cities (simple Euclidean check is enough for selection, or Haversine)
         # We use a rough approximation or just skip if DB match is very close (< 5km)
         if min_dist > 5000: # If nearest DB match is > 5km away, check fallbacks
-            from math import radians, cos, sin, asin, sqrt
-            def haversine(lon1, lat1, lon2, lat2):
-                R = 6371000 # Radius of earth in meters
-                dLat = radians(lat2 - lat1)
-                dLon = radians(lon2 - lon1)
-                a = sin(dLat/2) * sin(dLat/2) + cos(radians(lat1)) * cos(radians(lat2)) * sin(dLon/2) * sin(dLon/2)
-                c = 2 * asin(sqrt(a))
-                return R * c
-
-            for city_name, (f_lat, f_lon) in FALLBACK_CITY_COORDS.items():
-                dist = haversine(user_lon, user_lat, f_lon, f_lat)
-                if dist < min_dist:
-                    min_dist = dist
-                    inferred_city = city_name
+            city_name, dist = _nearest_fallback_city(user_lat, user_lon)
+            if dist < min_dist:
+                min_dist = dist
+                inferred_city = city_name
         
         # PostGIS query to find nearby pharmacies on duty
         # Modified to include Unmatched pharmacies ONLY if they match inferred city
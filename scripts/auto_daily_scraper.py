@@ -21,22 +21,82 @@ Usage:
 For Windows Task Scheduler or cron job at 8:00 AM daily.
 """
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 from datetime import datetime, date, timedelta
 import re
 import psycopg2
+from psycopg2.extras import execute_values
 import os
 import time
 import unicodedata
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+class _NameCharTable(dict):
+    """
+    str.translate table for normalize_name, filled lazily per character:
+    combining marks are dropped, word characters and whitespace are kept,
+    anything else (punctuation, symbols) becomes a space.
+    """
+    
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if unicodedata.category(char) == 'Mn':
+            value = None
+        elif char.isalnum() or char == '_' or char.isspace():
+            value = codepoint
+        else:
+            value = ' '
+        self[codepoint] = value
+        return value
+
+
+_NAME_CHAR_TABLE = _NameCharTable()
+
+# Common name prefixes, each stripped at most once and in this order
+_PREFIX_RE = re.compile(
+    r'^(?:pharmacie )?(?:pharmacy )?(?:pharma )?(?:la )?(?:le )?(?:les )?'
+    r'(?:de )?(?:du )?(?:d )?(?:des )?'
+)
+
+# Only the pharmacy blocks of a duty page are parsed into a tree
+_PHARMACY_BLOCK_CLASSES = frozenset({'ligne_pers', 'pharma_line', 'carousel-item'})
+
+
+def _is_pharmacy_block(class_value):
+    """Match a div class attribute (raw string at parse time) against the block classes."""
+    return bool(class_value) and not _PHARMACY_BLOCK_CLASSES.isdisjoint(class_value.split())
+
+
+_PHARMACY_BLOCKS = SoupStrainer('div', class_=_is_pharmacy_block)
+
+# Phone pattern: 3 digits then 2-digit groups (e.g. 234 89 72 04 or 655 43 96 62)
+_PHONE_RE = re.compile(r'(\d{3}\s*\d{2}\s*\d{2}\s*\d{2})')
+
+# Scraped-text cleanup patterns
+_TRAILING_SEP_RE = re.compile(r'[\s|]+$')
+_WS_RE = re.compile(r'\s+')
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+# Line prefixes that mark a pharmacy entry in the legacy carousel layout
+_PHARMACY_PREFIXES = ('PHARMACIE', 'PHARMACY')
+
+# Words ignored when extracting key words from a name
+_STOP_WORDS = frozenset({'de', 'du', 'la', 'le', 'les', 'des', 'et', 'a', 'au', 'aux'})
+
+
+@lru_cache(maxsize=8192)
 def normalize_name(name):
     """
     Normalize pharmacy name for matching.
     Handles accents, case, common abbreviations.
+    Results are memoised: the same names recur across the cache load and daily scrapes.
     """
     if not name:
         return ''
@@ -44,21 +104,12 @@ def normalize_name(name):
     # Convert to lowercase
     name = name.lower()
     
-    # Remove accents
-    name = unicodedata.normalize('NFD', name)
-    name = ''.join(c for c in name if unicodedata.category(c) != 'Mn')
-    
-    # Remove punctuation and extra spaces
-    name = re.sub(r'[^\w\s]', ' ', name)
-    name = re.sub(r'\s+', ' ', name).strip()
+    # Remove accents and punctuation in one pass, then collapse spaces
+    name = unicodedata.normalize('NFD', name).translate(_NAME_CHAR_TABLE)
+    name = ' '.join(name.split())
     
     # Remove common prefixes
-    prefixes = ['pharmacie ', 'pharmacy ', 'pharma ', 'la ', 'le ', 'les ', 'de ', 'du ', 'd ', 'des ']
-    for prefix in prefixes:
-        if name.startswith(prefix):
-            name = name[len(prefix):]
-    
-    return name.strip()
+    return _PREFIX_RE.sub('', name, count=1).strip()
 
 
 def get_key_words(name):
@@ -66,8 +117,7 @@ def get_key_words(name):
     normalized = normalize_name(name)
     words = normalized.split()
     # Filter short words and common words
-    stop_words = {'de', 'du', 'la', 'le', 'les', 'des', 'et', 'a', 'au', 'aux'}
-    key_words = [w for w in words if len(w) > 2 and w not in stop_words]
+    key_words = [w for w in words if len(w) > 2 and w not in _STOP_WORDS]
     return key_words
 
 
@@ -79,6 +129,9 @@ class AutoDailyScraper:
     
     BASE_URL = "https://www.annuaire-medical.cm"
     
+    # City pages fetched concurrently (kept small to be polite to the server)
+    SCRAPE_WORKERS = 4
+    
     # All cities with their regions
     CITIES = {
         'adamaoua': ['banyo', 'ngaoundere'],
@@ -293,12 +346,45 @@ class AutoDailyScraper:
         """
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept-Encoding': 'gzip, deflate'
         })
+        # Keep-alive pool sized for the concurrent city fetches, with backoff
+        # retries on rate-limit and gateway errors
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.SCRAPE_WORKERS,
+            max_retries=retry
+        ))
         self.db_conn = db_connection
         self._db_config = db_config
         self.schema = schema
         self._pharmacy_cache = None  # Cache all pharmacies from DB
+        self._pharmacy_by_id = {}  # id -> cache entry, built with the cache
+        self._pharmacy_by_name = {}  # normalized name -> id of first entry with it
+        
+        # Accent-free, lowercased CITY_COORDS key -> original key
+        self._city_keys = {}
+        for key in self.CITY_COORDS:
+            key_norm = unicodedata.normalize('NFD', key)
+            key_norm = ''.join(c for c in key_norm if unicodedata.category(c) != 'Mn')
+            self._city_keys.setdefault(key_norm.lower(), key)
+        
+        # Per city: quarter word (4+ letters) -> coords of the first quarter using it
+        self._quarter_words = {}
+        for city_key, quarters in self.QUARTER_COORDS.items():
+            words = {}
+            for q_name, coords in quarters.items():
+                for q_word in q_name.split():
+                    if len(q_word) >= 4:
+                        words.setdefault(q_word, coords)
+            self._quarter_words[city_key] = words
+        
+        # Flat (region, city) scrape order, ready to hand to the executor
+        self._city_plan = [
+            (region, city) for region, cities in self.CITIES.items() for city in cities
+        ]
         
     def get_db_connection(self):
         """Get database connection. Uses external connection if provided."""
@@ -341,6 +427,8 @@ class AutoDailyScraper:
         
         self._pharmacy_cache = []
         for row in rows:
+            key_words = get_key_words(row[1])
+            key_set = set(key_words)
             self._pharmacy_cache.append({
                 'id': row[0],
                 'nom': row[1],
@@ -348,8 +436,15 @@ class AutoDailyScraper:
                 'lat': row[3],
                 'lon': row[4],
                 'normalized': normalize_name(row[1]),
-                'key_words': get_key_words(row[1])
+                'key_words': key_words,
+                # Precomputed for find_pharmacy_match
+                'key_set': key_set,
+                'main_word': max(key_set, key=len) if key_set else ''
             })
+        self._pharmacy_by_id = {p['id']: p for p in self._pharmacy_cache}
+        self._pharmacy_by_name = {}
+        for p in self._pharmacy_cache:
+            self._pharmacy_by_name.setdefault(p['normalized'], p['id'])
         
         print(f"  Loaded {len(self._pharmacy_cache)} pharmacies from database")
     
@@ -369,13 +464,7 @@ class AutoDailyScraper:
         normalized = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
         normalized = normalized.strip()
         
-        # Try exact match first
-        for key in self.CITY_COORDS:
-            key_norm = unicodedata.normalize('NFD', key)
-            key_norm = ''.join(c for c in key_norm if unicodedata.category(c) != 'Mn')
-            if key_norm.lower() == normalized.lower():
-                return key
-        return None
+        return self._city_keys.get(normalized.lower())
     
     def geocode_quarter(self, city_name, quarter_text):
         """
@@ -406,17 +495,14 @@ class AutoDailyScraper:
                 return coords
         
         # Strategy 2: Check each word in the quarter text against known quarters
-        qt_words = re.sub(r'[^\w\s]', ' ', qt).split()
+        quarter_words = self._quarter_words[city_key]
+        qt_words = _PUNCT_RE.sub(' ', qt).split()
         for word in qt_words:
             if len(word) < 4:
                 continue
-            for q_name, coords in quarters.items():
-                q_words = q_name.split()
-                for q_word in q_words:
-                    if len(q_word) < 4:
-                        continue
-                    if word == q_word:
-                        return coords
+            coords = quarter_words.get(word)
+            if coords:
+                return coords
         
         return None
     
@@ -459,11 +545,7 @@ class AutoDailyScraper:
             quarter = entry.get('adresse', '')
             
             # Find this pharmacy in cache to check its current coords
-            db_pharm = None
-            for p in self._pharmacy_cache:
-                if p['id'] == pharmacy_id:
-                    db_pharm = p
-                    break
+            db_pharm = self._pharmacy_by_id.get(pharmacy_id)
             
             if not db_pharm:
                 continue
@@ -523,11 +605,12 @@ class AutoDailyScraper:
         
         # Try lxml first, fall back to html.parser
         try:
-            soup = BeautifulSoup(html, 'lxml')
+            soup = BeautifulSoup(html, 'lxml', parse_only=_PHARMACY_BLOCKS)
         except:
-            soup = BeautifulSoup(html, 'html.parser')
+            soup = BeautifulSoup(html, 'html.parser', parse_only=_PHARMACY_BLOCKS)
         
         pharmacies = []
+        seen = set()  # (nom, ville) already taken from this page
         
         # Find pharmacy entries — site uses both 'ligne_pers' and 'pharma_line' classes
         pharmacy_divs = soup.find_all('div', class_=['ligne_pers', 'pharma_line'])
@@ -547,20 +630,30 @@ class AutoDailyScraper:
                 full_text = item.get_text(separator=' | ', strip=True)
                 pharmacy = self.parse_pharmacy_line(full_text, city)
                 if pharmacy:
-                    pharmacies.append(pharmacy)
+                    key = (pharmacy['nom'], pharmacy['ville'])
+                    if key not in seen:
+                        seen.add(key)
+                        pharmacies.append(pharmacy)
         else:
             # Fallback: try carousel items (legacy site structure)
             carousel_items = soup.find_all('div', class_='carousel-item')
+            seen_lines = set()  # Repeated carousel lines parse to the same entry
             for item in carousel_items:
                 text = item.get_text(separator='\n', strip=True)
-                lines = text.split('\n')
-                for line in lines:
+                for line in text.splitlines():
                     line = line.strip()
-                    if not line.upper().startswith('PHARMACIE') and not line.upper().startswith('PHARMACY'):
+                    # Only the first 9 chars can match a prefix; don't uppercase the whole line
+                    if not line[:9].upper().startswith(_PHARMACY_PREFIXES):
+                        continue
+                    if line in seen_lines:
                         continue
+                    seen_lines.add(line)
                     pharmacy = self.parse_pharmacy_line(line, city)
                     if pharmacy:
-                        pharmacies.append(pharmacy)
+                        key = (pharmacy['nom'], pharmacy['ville'])
+                        if key not in seen:
+                            seen.add(key)
+                            pharmacies.append(pharmacy)
         
         return pharmacies
     
@@ -571,9 +664,6 @@ class AutoDailyScraper:
         Also handles legacy inline format: "NAME PHONE CITY: ADDRESS"
         """
         try:
-            # Phone pattern: 3 digits then 2-digit groups (e.g. 234 89 72 04 or 655 43 96 62)
-            phone_pattern = r'(\d{3}\s*\d{2}\s*\d{2}\s*\d{2})'
-            
             # If pipe-separated, split into parts
             if ' | ' in line:
                 parts = [p.strip() for p in line.split(' | ')]
@@ -582,7 +672,8 @@ class AutoDailyScraper:
                 adresse = ''
                 
                 for part in parts[1:]:
-                    phone_match = re.match(phone_pattern, part)
+                    # A phone part must start with a digit; skip the regex otherwise
+                    phone_match = _PHONE_RE.match(part) if part[:1].isdecimal() else None
                     if phone_match and not phone:
                         phone = phone_match.group(1).strip()
                     elif ':' in part:
@@ -593,7 +684,7 @@ class AutoDailyScraper:
                         adresse = part
             else:
                 # Legacy format: extract phone first, then name/address
-                phone_match = re.search(phone_pattern, line)
+                phone_match = _PHONE_RE.search(line)
                 if phone_match:
                     phone = phone_match.group(1).strip()
                     phone_idx = line.find(phone)
@@ -609,8 +700,8 @@ class AutoDailyScraper:
                     adresse = ''
             
             # Clean name: remove trailing pipes/spaces
-            nom = re.sub(r'[\s|]+$', '', nom)
-            nom = re.sub(r'\s+', ' ', nom).strip()
+            nom = _TRAILING_SEP_RE.sub('', nom)
+            nom = _WS_RE.sub(' ', nom).strip()
             
             if not nom:
                 return None
@@ -643,20 +734,30 @@ class AutoDailyScraper:
         if not scraped_normalized or len(scraped_normalized) < 3:
             return None
         
+        # Method 1: Exact normalized match = 100 points (instant win)
+        exact_id = self._pharmacy_by_name.get(scraped_normalized)
+        if exact_id is not None:
+            return exact_id
+        
+        # Longest scraped key word (usually most distinctive), for Method 4
+        scraped_main = max(scraped_keys, key=len) if scraped_keys else ''
+        
         best_match = None
         best_score = 0
         
+        # Loop invariants and local aliases for the scan below
+        check_contains = len(scraped_normalized) > 4
+        check_main = len(scraped_main) > 3
+        n_scraped_keys = len(scraped_keys)
+        overlap_with = scraped_keys.intersection
+        
         for db_pharmacy in self._pharmacy_cache:
             score = 0
             db_normalized = db_pharmacy['normalized']
-            db_keys = set(db_pharmacy['key_words'])
-            
-            # Method 1: Exact normalized match = 100 points (instant win)
-            if scraped_normalized == db_normalized:
-                return db_pharmacy['id']
+            db_keys = db_pharmacy['key_set']
             
             # Method 2: One name contains the other
-            if len(scraped_normalized) > 4 and len(db_normalized) > 4:
+            if check_contains and len(db_normalized) > 4:
                 if scraped_normalized in db_normalized:
                     score = max(score, 70)
                 elif db_normalized in scraped_normalized:
@@ -664,13 +765,13 @@ class AutoDailyScraper:
             
             # Method 3: Key word overlap
             if db_keys and scraped_keys:
-                overlap = db_keys.intersection(scraped_keys)
+                overlap = overlap_with(db_keys)
                 if overlap:
                     # Score based on overlap
                     overlap_score = len(overlap) * 25
                     
                     # Bonus if more than half of words match
-                    max_words = max(len(db_keys), len(scraped_keys))
+                    max_words = max(len(db_keys), n_scraped_keys)
                     if len(overlap) >= max_words / 2:
                         overlap_score += 20
                     
@@ -683,11 +784,9 @@ class AutoDailyScraper:
             
             # Method 4: Check if main distinctive word matches
             if scraped_keys and db_keys:
-                # Get longest word from each (usually most distinctive)
-                scraped_main = max(scraped_keys, key=len) if scraped_keys else ''
-                db_main = max(db_keys, key=len) if db_keys else ''
+                db_main = db_pharmacy['main_word']
                 
-                if scraped_main and db_main and len(scraped_main) > 3 and len(db_main) > 3:
+                if check_main and len(db_main) > 3:
                     if scraped_main == db_main:
                         score = max(score, 60)
                     elif scraped_main in db_main or db_main in scraped_main:
@@ -741,36 +840,45 @@ class AutoDailyScraper:
             WHERE date_garde = %s AND pharmacie_id IS NULL
         """, (garde_date,))
         
-        # Insert matched pharmacies (with pharmacie_id)
-        for entry in matched_entries:
-            cursor.execute(f"""
+        # Insert matched pharmacies (with pharmacie_id). One upsert cannot touch the
+        # same row twice, so keep the last entry per pharmacy like sequential upserts did.
+        matched_rows = {
+            entry['pharmacie_id']: (
+                entry['pharmacie_id'], garde_date,
+                entry['nom'], entry.get('adresse', ''), entry.get('ville', '')
+            )
+            for entry in matched_entries
+        }
+        if matched_rows:
+            upserted = execute_values(cursor, f"""
                 INSERT INTO {self._table('gardes')} 
                     (pharmacie_id, date_garde, nom_scrape, quarter_scrape, city_scrape)
-                VALUES (%s, %s, %s, %s, %s)
+                VALUES %s
                 ON CONFLICT (pharmacie_id, date_garde) DO UPDATE
                     SET nom_scrape = EXCLUDED.nom_scrape,
                         quarter_scrape = EXCLUDED.quarter_scrape,
                         city_scrape = EXCLUDED.city_scrape
-            """, (
-                entry['pharmacie_id'], garde_date,
-                entry['nom'], entry.get('adresse', ''), entry.get('ville', '')
-            ))
-            inserted += cursor.rowcount
+                RETURNING 1
+            """, list(matched_rows.values()), page_size=1000, fetch=True)
+            inserted += len(upserted)
         
         # Insert unmatched pharmacies (no pharmacie_id)
         if unmatched_entries:
-            for entry in unmatched_entries:
-                cursor.execute(f"""
-                    INSERT INTO {self._table('gardes')} 
-                        (pharmacie_id, date_garde, nom_scrape, quarter_scrape, city_scrape,
-                         approx_lat, approx_lon)
-                    VALUES (NULL, %s, %s, %s, %s, %s, %s)
-                """, (
+            added = execute_values(cursor, f"""
+                INSERT INTO {self._table('gardes')} 
+                    (pharmacie_id, date_garde, nom_scrape, quarter_scrape, city_scrape,
+                     approx_lat, approx_lon)
+                VALUES %s
+                RETURNING 1
+            """, [
+                (
                     garde_date,
                     entry['nom'], entry.get('adresse', ''), entry.get('ville', ''),
                     entry.get('latitude'), entry.get('longitude')
-                ))
-                inserted += cursor.rowcount
+                )
+                for entry in unmatched_entries
+            ], template="(NULL, %s, %s, %s, %s, %s, %s)", page_size=1000, fetch=True)
+            inserted += len(added)
         
         conn.commit()
         cursor.close()
@@ -795,16 +903,20 @@ class AutoDailyScraper:
         # Step 2: Scrape all cities
         print("\n[Step 2] Scraping pharmacy duty from website...")
         all_scraped = []
-        city_count = 0
+        city_plan = self._city_plan
+        city_count = len(city_plan)
+        
+        def scrape(region_city):
+            pharmacies = self.scrape_city(*region_city)
+            time.sleep(0.3)  # Be polite to the server
+            return pharmacies
         
-        for region, cities in self.CITIES.items():
-            for city in cities:
-                city_count += 1
-                pharmacies = self.scrape_city(region, city)
+        # Page fetches are network-bound; results still come back in city order
+        with ThreadPoolExecutor(max_workers=self.SCRAPE_WORKERS) as executor:
+            for (region, city), pharmacies in zip(city_plan, executor.map(scrape, city_plan)):
                 if pharmacies:
                     print(f"    {city.title()}: {len(pharmacies)} pharmacies de garde")
                     all_scraped.extend(pharmacies)
-                time.sleep(0.3)  # Be polite to the server
         
         print(f"\n  Total scraped: {len(all_scraped)} from {city_count} cities")
         
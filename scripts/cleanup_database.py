@@ -7,9 +7,11 @@ Database Cleanup Script
 4. Remove duplicates
 """
 import psycopg2
+from psycopg2.extras import execute_batch
 import re
 import os
 import math
+from collections import Counter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -62,6 +64,14 @@ CITY_CENTERS = {
 }
 
 
+# clean_name patterns, compiled once and applied in this order
+_PHONE_RE = re.compile(r'\d{3}\s*\d{2}\s*\d{2}\s*\d{2}')
+_SPACED_PHONE_RE = re.compile(r'\d{2,3}\s+\d{2}\s+\d{2}\s+\d{2}')
+_CITY_SUFFIX_RE = re.compile(r'[A-Za-zéèêëàâäùûüôîïç\-]+\s*:\s*$')
+_CITY_TAIL_RE = re.compile(r'[A-Za-zéèêëàâäùûüôîïç\-]+:.*$')
+_WS_RE = re.compile(r'\s+')
+
+
 def get_db_connection():
     return psycopg2.connect(
         host=os.getenv('DB_HOST', 'localhost'),
@@ -77,21 +87,24 @@ def detect_city(lat, lon):
     if lat is None or lon is None:
         return 'Inconnu'
     
-    min_dist = float('inf')
+    min_dist_sq = float('inf')
     closest_city = 'Inconnu'
     
+    # Longitude scale depends only on the pharmacy's latitude
+    lon_scale = 111 * math.cos(math.radians(lat))
+    
     for city, (city_lat, city_lon) in CITY_CENTERS.items():
-        # Calculate distance in km
+        # Squared distance in km² (no sqrt needed to compare)
         lat_diff = (lat - city_lat) * 111
-        lon_diff = (lon - city_lon) * 111 * math.cos(math.radians(lat))
-        dist = math.sqrt(lat_diff**2 + lon_diff**2)
+        lon_diff = (lon - city_lon) * lon_scale
+        dist_sq = lat_diff * lat_diff + lon_diff * lon_diff
         
-        if dist < min_dist:
-            min_dist = dist
+        if dist_sq < min_dist_sq:
+            min_dist_sq = dist_sq
             closest_city = city
     
     # Only assign city if within 30km
-    if min_dist > 30:
+    if min_dist_sq > 30 * 30:
         return 'Autre'
     
     return closest_city
@@ -103,15 +116,15 @@ def clean_name(name):
         return name
     
     # Remove phone numbers (pattern: digits with spaces)
-    name = re.sub(r'\d{3}\s*\d{2}\s*\d{2}\s*\d{2}', '', name)
-    name = re.sub(r'\d{2,3}\s+\d{2}\s+\d{2}\s+\d{2}', '', name)
+    name = _PHONE_RE.sub('', name)
+    name = _SPACED_PHONE_RE.sub('', name)
     
     # Remove city suffixes like "Nkongsamba:" or "Yaoundé:"
-    name = re.sub(r'[A-Za-zéèêëàâäùûüôîïç\-]+\s*:\s*$', '', name)
-    name = re.sub(r'[A-Za-zéèêëàâäùûüôîïç\-]+:.*$', '', name)
+    name = _CITY_SUFFIX_RE.sub('', name)
+    name = _CITY_TAIL_RE.sub('', name)
     
     # Clean up extra spaces
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _WS_RE.sub(' ', name).strip()
     
     return name
 
@@ -132,49 +145,61 @@ def main():
     pharmacies = cursor.fetchall()
     print(f"Total pharmacies: {len(pharmacies)}")
     
-    # Step 2: Update each pharmacy
-    updates = 0
-    city_counts = {}
+    # Step 2: Work out the new name/city for each pharmacy
+    changes = []
+    city_counts = Counter()
     
     for pid, nom, ville, lat, lon in pharmacies:
         new_name = clean_name(nom)
         new_city = detect_city(lat, lon)
         
         # Track city counts
-        city_counts[new_city] = city_counts.get(new_city, 0) + 1
+        city_counts[new_city] += 1
         
         # Only update if changed
         if new_name != nom or new_city != ville:
-            cursor.execute("""
-                UPDATE pharmacies 
-                SET nom = %s, ville = %s 
-                WHERE id = %s
-            """, (new_name, new_city, pid))
-            updates += 1
+            changes.append((new_name, new_city, pid))
+    
+    # Plan the UPDATE once on the server and send the changes in batches
+    cursor.execute("""
+        PREPARE update_pharmacy (text, text, integer) AS
+            UPDATE pharmacies SET nom = $1, ville = $2 WHERE id = $3
+    """)
+    execute_batch(cursor, "EXECUTE update_pharmacy (%s, %s, %s)", changes, page_size=500)
+    cursor.execute("DEALLOCATE update_pharmacy")
+    updates = len(changes)
     
     conn.commit()
     print(f"\nUpdated {updates} pharmacies")
     
     # Step 3: Show city distribution
     print("\nCity distribution after cleanup:")
-    for city, count in sorted(city_counts.items(), key=lambda x: -x[1])[:15]:
+    for city, count in city_counts.most_common(15):
         print(f"  {city}: {count}")
     
-    # Step 4: Remove duplicates (same name + same city)
+    # Step 4: Remove duplicates (same name + same city), keeping the newest id.
+    # One sorted pass per group instead of a self-join that pairs every duplicate
+    # with every other; rows without a city are never considered duplicates.
     cursor.execute("""
-        DELETE FROM pharmacies a
-        USING pharmacies b
-        WHERE a.id < b.id
-          AND LOWER(a.nom) = LOWER(b.nom)
-          AND a.ville = b.ville
+        DELETE FROM pharmacies
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY LOWER(nom), ville ORDER BY id DESC
+                       ) AS rn
+                FROM pharmacies
+                WHERE ville IS NOT NULL
+            ) ranked
+            WHERE rn > 1
+        )
     """)
     duplicates = cursor.rowcount
     conn.commit()
     print(f"\nRemoved {duplicates} duplicate pharmacies")
     
-    # Final count
-    cursor.execute("SELECT COUNT(*) FROM pharmacies")
-    final_count = cursor.fetchone()[0]
+    # Final count (every row was loaded above; only the DELETE removed any)
+    final_count = len(pharmacies) - duplicates
     print(f"\nFinal pharmacy count: {final_count}")
     
     # Show sample of cleaned data
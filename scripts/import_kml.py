@@ -4,8 +4,9 @@ Use this if you want to manually add pharmacy locations.
 
 For automatic import of all pharmacies, use import_osm_pharmacies.py instead!
 """
-import xml.etree.ElementTree as ET
+from lxml import etree
 import psycopg2
+from psycopg2.extras import execute_values
 import re
 import sys
 import os
@@ -13,6 +14,75 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# KML namespace and the fully-qualified tags/paths used by the parser
+KML_NS = 'http://www.opengis.net/kml/2.2'
+_PLACEMARK_TAG = f'{{{KML_NS}}}Placemark'
+_NAME_PATH = f'{{{KML_NS}}}name'
+_DESCRIPTION_PATH = f'{{{KML_NS}}}description'
+_COORDINATES_PATH = f'.//{{{KML_NS}}}coordinates'
+
+# "Key: value" fields looked up in each placemark description
+_ADDRESS_RE = re.compile(r'(?:Address|Adresse)\s*:\s*(.+)', re.I)
+_PHONE_RE = re.compile(r'(?:Phone|Tel|Telephone)\s*:\s*(.+)', re.I)
+_CITY_RE = re.compile(r'(?:City|Ville)\s*:\s*(.+)', re.I)
+
+
+def _parse_placemark(placemark) -> dict:
+    """Build a pharmacy dict from one <Placemark>, or None if it has no usable point."""
+    # Get name
+    name_elem = placemark.find(_NAME_PATH)
+    name = name_elem.text if name_elem is not None else 'Unknown'
+    
+    # Get description (may contain address/phone)
+    desc_elem = placemark.find(_DESCRIPTION_PATH)
+    description = desc_elem.text if desc_elem is not None else ''
+    
+    # Get coordinates
+    coords_elem = placemark.find(_COORDINATES_PATH)
+    if coords_elem is None or not coords_elem.text:
+        return None
+    
+    coords_text = coords_elem.text.strip()
+    # Format: longitude,latitude,altitude
+    parts = coords_text.split(',')
+    if len(parts) < 2:
+        return None
+    
+    try:
+        longitude = float(parts[0])
+        latitude = float(parts[1])
+    except ValueError:
+        return None
+    
+    # Parse address and phone from description
+    address = ''
+    phone = ''
+    city = ''
+    
+    # All three fields use a "Key: value" form, so no colon means no match
+    if description and ':' in description:
+        # Look for patterns like "Address: xxx" or "Phone: xxx"
+        addr_match = _ADDRESS_RE.search(description)
+        if addr_match:
+            address = addr_match.group(1).strip()
+        
+        phone_match = _PHONE_RE.search(description)
+        if phone_match:
+            phone = phone_match.group(1).strip()
+        
+        city_match = _CITY_RE.search(description)
+        if city_match:
+            city = city_match.group(1).strip()
+    
+    return {
+        'nom': name,
+        'adresse': address,
+        'telephone': phone,
+        'ville': city,
+        'latitude': latitude,
+        'longitude': longitude
+    }
+
 
 def parse_kml_file(kml_path: str) -> list:
     """
@@ -24,77 +94,29 @@ def parse_kml_file(kml_path: str) -> list:
     - <description> = Address, phone (optional)
     - <Point><coordinates> = lon,lat,altitude
     
+    Placemarks are streamed with lxml's iterparse and freed once read,
+    so memory stays flat regardless of the file size.
+    
     Returns list of pharmacy dicts.
     """
     print(f"Parsing KML file: {kml_path}")
     
-    # KML namespace
-    ns = {'kml': 'http://www.opengis.net/kml/2.2'}
+    pharmacies = []
     
     try:
-        tree = ET.parse(kml_path)
-        root = tree.getroot()
-    except Exception as e:
+        for _, placemark in etree.iterparse(kml_path, tag=_PLACEMARK_TAG):
+            pharmacy = _parse_placemark(placemark)
+            if pharmacy:
+                pharmacies.append(pharmacy)
+            
+            # Drop the parsed placemark and anything before it from the tree
+            placemark.clear()
+            while placemark.getprevious() is not None:
+                del placemark.getparent()[0]
+    except (etree.LxmlError, OSError) as e:
         print(f"Error parsing KML: {e}")
         return []
     
-    pharmacies = []
-    
-    # Find all Placemarks
-    for placemark in root.iter('{http://www.opengis.net/kml/2.2}Placemark'):
-        # Get name
-        name_elem = placemark.find('kml:name', ns) or placemark.find('{http://www.opengis.net/kml/2.2}name')
-        name = name_elem.text if name_elem is not None else 'Unknown'
-        
-        # Get description (may contain address/phone)
-        desc_elem = placemark.find('kml:description', ns) or placemark.find('{http://www.opengis.net/kml/2.2}description')
-        description = desc_elem.text if desc_elem is not None else ''
-        
-        # Get coordinates
-        coords_elem = placemark.find('.//kml:coordinates', ns) or placemark.find('.//{http://www.opengis.net/kml/2.2}coordinates')
-        if coords_elem is None or not coords_elem.text:
-            continue
-        
-        coords_text = coords_elem.text.strip()
-        # Format: longitude,latitude,altitude
-        parts = coords_text.split(',')
-        if len(parts) < 2:
-            continue
-        
-        try:
-            longitude = float(parts[0])
-            latitude = float(parts[1])
-        except ValueError:
-            continue
-        
-        # Parse address and phone from description
-        address = ''
-        phone = ''
-        city = ''
-        
-        if description:
-            # Look for patterns like "Address: xxx" or "Phone: xxx"
-            addr_match = re.search(r'(?:Address|Adresse)\s*:\s*(.+)', description, re.I)
-            if addr_match:
-                address = addr_match.group(1).strip()
-            
-            phone_match = re.search(r'(?:Phone|Tel|Telephone)\s*:\s*(.+)', description, re.I)
-            if phone_match:
-                phone = phone_match.group(1).strip()
-            
-            city_match = re.search(r'(?:City|Ville)\s*:\s*(.+)', description, re.I)
-            if city_match:
-                city = city_match.group(1).strip()
-        
-        pharmacies.append({
-            'nom': name,
-            'adresse': address,
-            'telephone': phone,
-            'ville': city,
-            'latitude': latitude,
-            'longitude': longitude
-        })
-    
     print(f"Found {len(pharmacies)} pharmacies in KML file")
     return pharmacies
 
@@ -107,30 +129,40 @@ def import_to_database(pharmacies: list, db_config: dict):
     
     print(f"\nImporting {len(pharmacies)} pharmacies to database...")
     
+    # Truncate to the column widths so one long description cannot fail the batch
+    rows = [
+        (
+            (pharmacy['nom'] or 'Unknown')[:255],
+            pharmacy['adresse'][:255],
+            pharmacy['telephone'][:50],
+            pharmacy['ville'][:100],
+            pharmacy['longitude'],
+            pharmacy['latitude']
+        )
+        for pharmacy in pharmacies
+    ]
+    
+    conn = None
+    cursor = None
     try:
         conn = psycopg2.connect(**db_config)
         cursor = conn.cursor()
         
-        imported = 0
+        # Don't wait for the WAL flush at commit
+        cursor.execute("SET LOCAL synchronous_commit = off")
         
-        for pharmacy in pharmacies:
-            cursor.execute("""
-                INSERT INTO pharmacies (nom, adresse, telephone, ville, geom, source)
-                VALUES (%s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), 'google_earth')
-                ON CONFLICT DO NOTHING
-                RETURNING id;
-            """, (
-                pharmacy['nom'],
-                pharmacy['adresse'],
-                pharmacy['telephone'],
-                pharmacy['ville'],
-                pharmacy['longitude'],
-                pharmacy['latitude']
-            ))
-            
-            if cursor.fetchone():
-                imported += 1
-                print(f"  ✓ {pharmacy['nom']}")
+        # One multi-row INSERT per page instead of one round-trip per placemark
+        inserted = execute_values(cursor, """
+            INSERT INTO pharmacies (nom, adresse, telephone, ville, geom, source)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+            RETURNING id
+        """, rows,
+            template="(%s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), 'google_earth')",
+            page_size=1000,
+            fetch=True
+        )
+        imported = len(inserted)
         
         conn.commit()
         print(f"\nImport complete: {imported} pharmacies added")
@@ -6,27 +6,76 @@ OpenStreetMap is a FREE source for pharmacy locations with GPS coordinates!
 This is much faster than manually adding pharmacies in Google Earth Pro.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import hashlib
+import io
 import psycopg2
 import time
 import sys
 import os
 
+try:
+    import orjson  # Optional: much faster JSON decode/encode for large payloads
+except ImportError:
+    orjson = None
+
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Overpass API endpoint
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
 
+# Raw Overpass responses are cached on disk so repeated runs skip the API.
+# The cache sits in the repo's data/ directory (next to the JSON backup), not
+# the shared temp dir, so other local users cannot plant a response to import.
+OVERPASS_CACHE_TTL = 24 * 3600  # seconds
+OVERPASS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def get_overpass_session() -> requests.Session:
+    """
+    Build a requests session for the Overpass API.
+    
+    Retries rate-limited (429) and overloaded-gateway (502/503/504) answers
+    with exponential backoff. The query is sent as a POST, so POST is added
+    to the retryable methods.
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(['GET', 'POST'])
+    )
+    session = requests.Session()
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    session.mount('https://', HTTPAdapter(max_retries=retry))
+    return session
+
+
+def _decode_json(raw: bytes):
+    """Decode a JSON payload, using orjson when it is installed."""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
 
-def fetch_cameroon_pharmacies() -> list:
+def get_overpass_cache_path(query: str) -> str:
+    """Return the on-disk cache file for an Overpass query (keyed by SHA1 of the query)."""
+    key = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    return os.path.join(OVERPASS_CACHE_DIR, f'overpass_{key}.json')
+
+
+def fetch_cameroon_pharmacies(use_cache: bool = True) -> list:
     """
     Fetch all pharmacies in Cameroon from OpenStreetMap via Overpass API.
     
+    Args:
+        use_cache: Reuse a cached response younger than OVERPASS_CACHE_TTL
+                   instead of querying Overpass again.
+    
     Returns list of pharmacies with lat, lon, name, and other tags.
     """
     print("Fetching pharmacies from OpenStreetMap...")
-    print("This may take a minute...")
     
     # Overpass QL query to get all pharmacies in Cameroon
     # This finds all nodes/ways/relations tagged as amenity=pharmacy
@@ -43,24 +92,55 @@ def fetch_cameroon_pharmacies() -> list:
     );
     
     // Output with center coordinates for ways/relations
-    out center;
+    // (qt = quadtile order, skips the server-side sort by id)
+    out center qt;
     """
     
+    cache_path = get_overpass_cache_path(query)
+    if use_cache and os.path.exists(cache_path):
+        age = time.time() - os.path.getmtime(cache_path)
+        if age < OVERPASS_CACHE_TTL:
+            try:
+                with open(cache_path, 'rb') as f:
+                    elements = _decode_json(f.read()).get('elements', [])
+                print(f"Using cached Overpass response ({age / 3600:.1f}h old): {cache_path}")
+                print(f"Found {len(elements)} pharmacies in OpenStreetMap!")
+                return elements
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable Overpass cache: {e}")
+    
+    print("This may take a minute...")
+    
     try:
-        response = requests.post(
-            OVERPASS_URL,
-            data={'data': query},
-            timeout=180
-        )
+        with get_overpass_session() as session:
+            response = session.post(
+                OVERPASS_URL,
+                data={'data': query},
+                timeout=180
+            )
         response.raise_for_status()
         
-        data = response.json()
+        data = _decode_json(response.content)
         elements = data.get('elements', [])
         
+        # Only cache complete answers: on a server-side timeout or runtime
+        # error Overpass still returns 200, with a "remark" and partial elements
+        if data.get('remark') or not elements:
+            print(f"Not caching incomplete Overpass response: {data.get('remark', 'no elements')}")
+        else:
+            try:
+                os.makedirs(OVERPASS_CACHE_DIR, exist_ok=True)
+                tmp_path = f"{cache_path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(response.content)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                print(f"Warning: could not write Overpass cache: {e}")
+        
         print(f"Found {len(elements)} pharmacies in OpenStreetMap!")
         return elements
         
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         print(f"Error fetching from Overpass API: {e}")
         return []
 
@@ -77,15 +157,13 @@ def parse_osm_pharmacy(element: dict) -> dict:
     """
     tags = element.get('tags', {})
     
+    osm_type = element['type']
+    
     # Get coordinates (different for nodes vs ways/relations)
-    if element['type'] == 'node':
-        lat = element.get('lat')
-        lon = element.get('lon')
-    else:
-        # Ways and relations have center coordinates
-        center = element.get('center', {})
-        lat = center.get('lat')
-        lon = center.get('lon')
+    # Ways and relations have center coordinates
+    point = element if osm_type == 'node' else element.get('center', {})
+    lat = point.get('lat')
+    lon = point.get('lon')
     
     if not lat or not lon:
         return None
@@ -100,16 +178,30 @@ def parse_osm_pharmacy(element: dict) -> dict:
         'latitude': lat,
         'longitude': lon,
         'osm_id': element.get('id'),
-        'osm_type': element.get('type')
+        'osm_type': osm_type
     }
     
     return pharmacy
 
 
+def _copy_field(value) -> str:
+    """Format one value for COPY ... FROM STDIN (text format)."""
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
 def import_to_database(pharmacies: list, db_config: dict):
     """
     Import pharmacies into PostgreSQL database.
     
+    Rows are streamed with COPY into a temporary staging table, then moved
+    into pharmacies with a single INSERT ... SELECT that builds the geometry.
+    
     Args:
         pharmacies: List of pharmacy dicts
         db_config: Database connection config
@@ -120,42 +212,57 @@ def import_to_database(pharmacies: list, db_config: dict):
     
     print(f"\nImporting {len(pharmacies)} pharmacies to database...")
     
+    # Build the COPY payload (tab-separated, truncated to the column widths)
+    buffer = io.StringIO()
+    total = 0
+    for pharmacy in pharmacies:
+        if not pharmacy:
+            continue
+        buffer.write('\t'.join((
+            _copy_field(pharmacy['nom'][:255]),
+            _copy_field((pharmacy['adresse'] or '')[:255]),
+            _copy_field((pharmacy['telephone'] or '')[:50]),
+            _copy_field((pharmacy['ville'] or '')[:100]),
+            _copy_field((pharmacy['region'] or '')[:100]),
+            _copy_field(pharmacy['longitude']),
+            _copy_field(pharmacy['latitude'])
+        )))
+        buffer.write('\n')
+        total += 1
+    buffer.seek(0)
+    
+    conn = None
+    cursor = None
     try:
         conn = psycopg2.connect(**db_config)
         cursor = conn.cursor()
         
-        imported = 0
-        skipped = 0
+        # Don't wait for the WAL flush at commit
+        cursor.execute("SET LOCAL synchronous_commit = off")
         
-        for pharmacy in pharmacies:
-            if not pharmacy:
-                continue
-            
-            try:
-                # Insert pharmacy (update if exists based on OSM ID)
-                cursor.execute("""
-                    INSERT INTO pharmacies (nom, adresse, telephone, ville, region, geom, source)
-                    VALUES (%s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), 'osm')
-                    ON CONFLICT DO NOTHING
-                    RETURNING id;
-                """, (
-                    pharmacy['nom'],
-                    pharmacy['adresse'],
-                    pharmacy['telephone'],
-                    pharmacy['ville'],
-                    pharmacy['region'],
-                    pharmacy['longitude'],
-                    pharmacy['latitude']
-                ))
-                
-                if cursor.fetchone():
-                    imported += 1
-                else:
-                    skipped += 1
-                    
-            except Exception as e:
-                print(f"  Error importing {pharmacy['nom']}: {e}")
-                skipped += 1
+        cursor.execute("""
+            CREATE TEMP TABLE pharmacies_stage (
+                nom TEXT,
+                adresse TEXT,
+                telephone TEXT,
+                ville TEXT,
+                region TEXT,
+                lon DOUBLE PRECISION,
+                lat DOUBLE PRECISION
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert("COPY pharmacies_stage FROM STDIN WITH (FORMAT text)", buffer)
+        
+        cursor.execute("""
+            INSERT INTO pharmacies (nom, adresse, telephone, ville, region, geom, source)
+            SELECT nom, adresse, telephone, ville, region,
+                   ST_SetSRID(ST_MakePoint(lon, lat), 4326), 'osm'
+            FROM pharmacies_stage
+            ON CONFLICT DO NOTHING
+        """)
+        
+        imported = cursor.rowcount
+        skipped = total - imported
         
         conn.commit()
         print(f"Import complete: {imported} added, {skipped} skipped")
@@ -170,16 +277,24 @@ def import_to_database(pharmacies: list, db_config: dict):
 
 
 def save_to_json(pharmacies: list, filename: str = 'osm_pharmacies_cameroon.json'):
-    """Save pharmacies to JSON file for backup/review."""
+    """
+    Save pharmacies to JSON file for backup/review.
+    
+    Args:
+        pharmacies: Pharmacy dicts already parsed by parse_osm_pharmacy()
+        filename: Output file name inside the data/ directory
+    """
     filepath = os.path.join(os.path.dirname(__file__), '..', 'data', filename)
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
     
-    parsed = [parse_osm_pharmacy(p) for p in pharmacies if parse_osm_pharmacy(p)]
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(parsed, f, indent=2, ensure_ascii=False)
+    if orjson:
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(pharmacies, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(pharmacies, f, indent=2, ensure_ascii=False)
     
-    print(f"Saved {len(parsed)} pharmacies to {filepath}")
+    print(f"Saved {len(pharmacies)} pharmacies to {filepath}")
 
 
 def main():
@@ -196,24 +311,20 @@ def main():
     print()
     print("-" * 60)
     
-    # Fetch from OSM
-    osm_elements = fetch_cameroon_pharmacies()
+    # Fetch from OSM (--refresh bypasses the on-disk Overpass cache)
+    osm_elements = fetch_cameroon_pharmacies(use_cache='--refresh' not in sys.argv)
     
     if not osm_elements:
         print("No pharmacies found or error occurred")
         return
     
-    # Parse elements
-    pharmacies = []
-    for element in osm_elements:
-        parsed = parse_osm_pharmacy(element)
-        if parsed:
-            pharmacies.append(parsed)
+    # Parse elements (once; the JSON backup and the import reuse this list)
+    pharmacies = [p for p in map(parse_osm_pharmacy, osm_elements) if p]
     
     print(f"\nParsed {len(pharmacies)} pharmacies with valid coordinates")
     
     # Save to JSON for backup
-    save_to_json(osm_elements)
+    save_to_json(pharmacies)
     
     # Show sample
     print("\n--- Sample pharmacies found ---")
@@ -227,6 +338,7 @@ def main():
     # Ask user if they want to import to database
     print("\nTo import to database, run with --import flag and provide DB config:")
     print("  python import_osm_pharmacies.py --import")
+    print("Add --refresh to ignore the cached Overpass response.")
     
     if '--import' in sys.argv:
         # Default database config (update as needed)
@@ -74,6 +74,9 @@ CREATE TABLE IF NOT EXISTS :resolved_schema.gardes (
 -- Spatial index for fast distance queries (VERY IMPORTANT!)
 CREATE INDEX IF NOT EXISTS idx_pharmacies_geom ON :resolved_schema.pharmacies USING GIST (geom);
 
+-- Geography index so radius searches on geom::geography (ST_DWithin) can use it
+CREATE INDEX IF NOT EXISTS idx_pharmacies_geog ON :resolved_schema.pharmacies USING GIST ((geom::geography));
+
 -- Index on pharmacy name for text search
 CREATE INDEX IF NOT EXISTS idx_pharmacies_nom ON :resolved_schema.pharmacies (nom);
 